@@ -1,11 +1,82 @@
 """OpenAI-compatible API client with streaming."""
 import asyncio
 import aiohttp
-import json
-from typing import AsyncGenerator, List, Optional, Dict
+import orjson
+from typing import AsyncGenerator, List, Optional, Dict, Sequence, Tuple
 from config import config
 
 
+# SSE framing markers, matched against raw bytes lines
+_SSE_DATA = b"data: "
+_SSE_DONE = b"[DONE]"
+
+# Per-response read buffer; pinned so older aiohttp releases (64 KiB default)
+# buffer as much of a fast stream per wakeup as current ones do
+READ_BUFSIZE = 256 * 1024
+
+# Encoded context pieces smaller than this are batched into one body chunk
+BODY_CHUNK_SIZE = 64 * 1024
+
+# Prompt caching marker (Anthropic-style) for the end of a stable prompt prefix
+_CACHE_CONTROL = {"type": "ephemeral"}
+
+# Framing of the leading context system message, with plain string content or
+# as a single text block carrying the prompt caching marker
+_CONTEXT_OPEN = b'[{"role":"system","content":"'
+_CONTEXT_CLOSE = b'"}'
+_CACHED_CONTEXT_OPEN = b'[{"role":"system","content":[{"type":"text","text":"'
+_CACHED_CONTEXT_CLOSE = b'","cache_control":' + orjson.dumps(_CACHE_CONTROL) + b'}]}'
+
+# Upper bound for a JSON frame split across lines before it is dropped as garbage
+MAX_PARTIAL_FRAME = 1024 * 1024
+
+
+async def _iter_line_batches(content: aiohttp.StreamReader) -> AsyncGenerator[List[bytes], None]:
+    """
+    Split a response body into raw lines without decoding it to str.
+    
+    Lines are yielded in batches: every complete line that arrived with one
+    network read, so the caller can handle them all before yielding itself.
+    """
+    buf = bytearray()
+    async for chunk in content.iter_any():
+        buf += chunk
+        end = buf.rfind(b"\n")
+        if end == -1:
+            continue
+        lines = bytes(buf[:end]).split(b"\n")
+        del buf[:end + 1]
+        yield lines
+    if buf:
+        yield [bytes(buf)]
+
+
+def _mark_cache_breakpoint(messages: List[Dict[str, str]]) -> List[Dict]:
+    """Return messages with the last one's content as a text block marked for prompt caching."""
+    last = messages[-1]
+    block = {"type": "text", "text": last["content"], "cache_control": _CACHE_CONTROL}
+    return [*messages[:-1], {**last, "content": [block]}]
+
+
+def _decode_split_frame(partial: bytearray, line: bytes) -> Optional[dict]:
+    """
+    Accumulate a JSON frame that arrived over several lines.
+    
+    Returns the decoded frame once ``partial`` holds a complete object,
+    otherwise None. Lines that cannot start a frame are ignored.
+    """
+    if not partial and not line.startswith(b"{"):
+        return None
+    
+    partial += line
+    try:
+        return orjson.loads(partial)
+    except orjson.JSONDecodeError:
+        if len(partial) > MAX_PARTIAL_FRAME:
+            partial.clear()
+        return None
+
+
 class APIClient:
     """Async OpenAI-compatible API client with streaming support."""
     
@@ -15,7 +86,17 @@ class APIClient:
         self.api_key = config.api_key
         self.model = config.model
         self.proxy = config.proxy
+        self.prompt_cache = config.prompt_cache
         self.session: Optional[aiohttp.ClientSession] = None
+        
+        # Request URL and headers never change for a client, so build them once
+        self._url = f"{self.base_url}/chat/completions"
+        self._headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+        # (max_tokens, temperature) -> encoded request fields preceding "messages"
+        self._payload_prefixes: Dict[Tuple[Optional[int], float], bytes] = {}
     
     async def __aenter__(self):
         """Context manager entry."""
@@ -30,7 +111,19 @@ class APIClient:
         """Create session."""
         if self.session is None:
             timeout = aiohttp.ClientTimeout(total=None)
-            self.session = aiohttp.ClientSession(timeout=timeout)
+            # Keep pooled connections alive between chat turns so follow-up
+            # requests skip the TCP/TLS handshake
+            connector = aiohttp.TCPConnector(
+                limit=10,
+                limit_per_host=10,
+                ttl_dns_cache=300,
+                keepalive_timeout=75,
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=timeout,
+                read_bufsize=READ_BUFSIZE,
+            )
     
     async def disconnect(self) -> None:
         """Close session."""
@@ -38,48 +131,95 @@ class APIClient:
             await self.session.close()
             self.session = None
     
+    def _payload_prefix(self, max_tokens: Optional[int], temperature: float) -> bytes:
+        """Get the encoded request body up to and including the "messages" key."""
+        key = (max_tokens, temperature)
+        prefix = self._payload_prefixes.get(key)
+        if prefix is None:
+            payload = {
+                "model": self.model,
+                "stream": True,
+                "temperature": temperature,
+            }
+            if max_tokens:
+                payload["max_tokens"] = max_tokens
+            prefix = orjson.dumps(payload)[:-1] + b',"messages":'
+            self._payload_prefixes[key] = prefix
+        return prefix
+    
+    async def _iter_body(
+        self,
+        prefix: bytes,
+        messages: List[Dict[str, str]],
+        context: Sequence[str],
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        Encode the request body piece by piece.
+        
+        The context fragments become a leading system message whose content
+        is JSON-escaped one fragment at a time, so large attached files are
+        never joined into one string or one body buffer. With prompt caching
+        enabled the message is marked as a cache breakpoint.
+        """
+        buf = bytearray(prefix)
+        buf += _CACHED_CONTEXT_OPEN if self.prompt_cache else _CONTEXT_OPEN
+        for fragment in context:
+            encoded = orjson.dumps(fragment)[1:-1]
+            if len(encoded) < BODY_CHUNK_SIZE:
+                buf += encoded
+                continue
+            if buf:
+                yield bytes(buf)
+                buf.clear()
+            yield encoded
+        buf += _CACHED_CONTEXT_CLOSE if self.prompt_cache else _CONTEXT_CLOSE
+        if messages:
+            buf += b","
+            buf += orjson.dumps(messages)[1:]
+        else:
+            buf += b"]"
+        buf += b"}"
+        yield bytes(buf)
+    
     async def stream_chat(
         self,
         messages: List[Dict[str, str]],
         max_tokens: Optional[int] = None,
         temperature: float = 0.1,
+        context: Sequence[str] = (),
     ) -> AsyncGenerator[str, None]:
         """
         Stream chat completion tokens.
         
         Args:
-            messages: List of message dicts with "role" and "content"
+            messages: List of message dicts with "role" and "content"; with
+                prompt caching enabled the last one is marked as a cache breakpoint
             max_tokens: Maximum tokens in response
             temperature: Sampling temperature
+            context: Fragments of a system message sent before the messages,
+                streamed into the request body without being joined
             
         Yields:
-            Tokens as they arrive from the API
+            Text chunks as they arrive from the API, with tokens that arrive
+            in quick succession joined into one chunk
         """
-        if self.session is None:
-            await self.connect()
-        
-        url = f"{self.base_url}/chat/completions"
-        
-        payload = {
-            "model": self.model,
-            "messages": messages,
-            "stream": True,
-            "temperature": temperature,
-        }
-        
-        if max_tokens:
-            payload["max_tokens"] = max_tokens
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
+        # Only the messages change between turns; the other fields are encoded
+        # once and spliced in front of the freshly encoded messages array
+        prefix = self._payload_prefix(max_tokens, temperature)
+        if self.prompt_cache and messages:
+            # Everything up to the newest message is resent unchanged next turn
+            messages = _mark_cache_breakpoint(messages)
+        if context:
+            # Sent with chunked transfer encoding
+            body = self._iter_body(prefix, messages, context)
+        else:
+            body = prefix + orjson.dumps(messages) + b"}"
         
         try:
             async with self.session.post(
-                url,
-                json=payload,
-                headers=headers,
+                self._url,
+                data=body,
+                headers=self._headers,
                 proxy=self.proxy,
                 ssl=False,
             ) as resp:
@@ -87,32 +227,54 @@ class APIClient:
                     error_text = await resp.text()
                     raise Exception(f"API error {resp.status}: {error_text}")
                 
-                async for line in resp.content:
-                    # Check for cancellation frequently
-                    try:
-                        asyncio.current_task()
-                    except RuntimeError:
-                        raise asyncio.CancelledError()
-                    
-                    line = line.decode("utf-8").strip()
-                    
-                    if not line:
-                        continue
-                    
-                    if line.startswith("data: "):
-                        line = line[6:]
-                    
-                    if line == "[DONE]":
-                        break
-                    
-                    try:
-                        data = json.loads(line)
+                # Tokens are coalesced so the consumer wakes at most once per
+                # network read; nothing is held back waiting for a later read
+                pending: List[str] = []
+                partial = bytearray()
+                
+                # Cancellation is delivered at the awaits inside this loop
+                async for lines in _iter_line_batches(resp.content):
+                    done = False
+                    for line in lines:
+                        # Only the line ending is dropped: a continuation of a
+                        # split frame may start with whitespace from inside a string
+                        line = line.rstrip(b"\r")
+                        
+                        if not line:
+                            continue
+                        
+                        if line.startswith(_SSE_DATA):
+                            line = line[len(_SSE_DATA):]
+                        
+                        if line == _SSE_DONE:
+                            done = True
+                            break
+                        
+                        try:
+                            # orjson.loads accepts bytes, so the payload is never decoded to str first
+                            data = orjson.loads(line)
+                        except orjson.JSONDecodeError:
+                            # Some providers split one JSON delta over several lines
+                            data = _decode_split_frame(partial, line)
+                            if data is None:
+                                continue
+                        partial.clear()
+                        
                         delta = data.get("choices", [{}])[0].get("delta", {})
                         token = delta.get("content", "")
                         if token:
-                            yield token
-                    except json.JSONDecodeError:
-                        continue
+                            pending.append(token)
+                    
+                    # Every token that arrived with this read is drained before
+                    # handing a chunk to the consumer
+                    if done:
+                        break
+                    if pending:
+                        yield "".join(pending)
+                        pending.clear()
+                
+                if pending:
+                    yield "".join(pending)
         
         except asyncio.CancelledError:
             raise
@@ -123,5 +285,5 @@ class APIClient:
         """Estimate token count for messages (rough approximation)."""
         total = 0
         for msg in messages:
-            total += len(msg.get("content", "")) // 4
+            total += len(msg.get("content", "")) >> 2
         return total
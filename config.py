@@ -1,7 +1,52 @@
 """Configuration loader from .env file."""
 import os
+from functools import cached_property
+from pathlib import Path
 from typing import Optional
-from dotenv import load_dotenv
+
+
+def _find_dotenv() -> Optional[Path]:
+    """Find the nearest .env file, starting from this module's directory."""
+    directory = Path(__file__).resolve().parent
+    for candidate_dir in (directory, *directory.parents):
+        candidate = candidate_dir / ".env"
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def _load_dotenv() -> None:
+    """Load KEY=VALUE lines from the .env file; variables already set win."""
+    path = _find_dotenv()
+    if path is None:
+        return
+    
+    try:
+        data = path.read_bytes().decode("utf-8")
+    except (OSError, UnicodeDecodeError):
+        return
+    
+    for line in data.split("\n"):
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        if line.startswith("export "):
+            line = line[7:]
+        
+        key, _, value = line.partition("=")
+        key = key.strip()
+        if not key:
+            continue
+        value = value.strip()
+        
+        quote = value[:1]
+        if quote in ("'", '"') and value.find(quote, 1) != -1:
+            value = value[1:value.find(quote, 1)]
+        else:
+            # Drop inline comments on unquoted values
+            value = value.split(" #", 1)[0].rstrip()
+        
+        os.environ.setdefault(key, value)
 
 
 class Config:
@@ -9,17 +54,46 @@ class Config:
     
     def __init__(self):
         """Load configuration from .env file."""
-        load_dotenv()
-        
-        self.base_url: str = os.getenv("OPENAI_BASE_URL", "http://localhost:8000/v1")
-        self.api_key: str = os.getenv("OPENAI_API_KEY", "sk-xxxx")
-        self.model: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-        self.proxy: Optional[str] = os.getenv("OPENAI_PROXY")
-        self.system_prompt: str = os.getenv(
+        _load_dotenv()
+    
+    # Values are read from the environment on first access only
+    @cached_property
+    def base_url(self) -> str:
+        """API endpoint base URL."""
+        return os.getenv("OPENAI_BASE_URL", "http://localhost:8000/v1")
+    
+    @cached_property
+    def api_key(self) -> str:
+        """API key."""
+        return os.getenv("OPENAI_API_KEY", "sk-xxxx")
+    
+    @cached_property
+    def model(self) -> str:
+        """Model name."""
+        return os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    
+    @cached_property
+    def proxy(self) -> Optional[str]:
+        """Optional HTTP proxy."""
+        return os.getenv("OPENAI_PROXY")
+    
+    @cached_property
+    def system_prompt(self) -> str:
+        """System prompt."""
+        return os.getenv(
             "OPENAI_PROMPT",
             "You are a helpful coding assistant."
         )
-        self.max_tokens: int = int(os.getenv("OPENAI_MAX_TOKENS", "4096"))
+    
+    @cached_property
+    def max_tokens(self) -> int:
+        """Maximum tokens per response."""
+        return int(os.getenv("OPENAI_MAX_TOKENS", "4096"))
+    
+    @cached_property
+    def prompt_cache(self) -> bool:
+        """Mark the stable prompt prefix with cache_control for prompt caching."""
+        return os.getenv("OPENAI_PROMPT_CACHE", "").strip().lower() in ("1", "true", "yes")
     
     def validate(self) -> bool:
         """Validate configuration."""
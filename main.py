@@ -7,6 +7,7 @@ from pathlib import Path
 # Add project root to path
 sys.path.insert(0, str(Path(__file__).parent))
 
+from api import APIClient
 from config import config
 from ui import TUI
 
@@ -21,9 +22,10 @@ async def main():
         print(f"  OPENAI_MODEL: {config.model}")
         sys.exit(1)
     
-    # Run the CLI
-    cli = TUI()
-    await cli.run()
+    # Run the CLI with one API client (and connection pool) for the whole session
+    async with APIClient() as client:
+        cli = TUI()
+        await cli.run(client)
 
 
 if __name__ == "__main__":
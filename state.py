@@ -1,118 +1,369 @@
 """Application state management."""
 import asyncio
-from dataclasses import dataclass, field
-from typing import List, Optional
+import stat
+import sys
+from collections import OrderedDict
+from typing import List, Optional, Tuple
 from pathlib import Path
 
 
-@dataclass
+# Maximum number of file contents kept in the attachment cache
+FILE_CACHE_SIZE = 64
+
+# Once the conversation estimate exceeds SUMMARIZE_THRESHOLD of the token limit,
+# older turns are summarized so the recent ones fit in SUMMARIZE_KEEP of it
+SUMMARIZE_THRESHOLD = 0.8
+SUMMARIZE_KEEP = 0.5
+
+# Longest excerpt of one message kept in a summary
+SUMMARY_EXCERPT_CHARS = 160
+
+_SUMMARY_HEADER = "Summary of the earlier conversation:"
+
+
+def _estimate_tokens(text: str) -> int:
+    """Estimate token count (rough approximation: 1 token ≈ 4 characters)."""
+    return len(text) >> 2
+
+
+def _read_text(file_path: Path) -> str:
+    """Read a whole text file (blocking; run it in a worker thread)."""
+    with open(file_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+# Interned role strings: every message shares these objects, so role checks
+# succeed on the identity fast path of ==/in
+_ROLE_SYSTEM = sys.intern("system")
+_ROLE_USER = sys.intern("user")
+_ROLE_ASSISTANT = sys.intern("assistant")
+_ROLE_ERROR = sys.intern("error")
+
+# Roles that are sent to the API
+_API_ROLES = (_ROLE_USER, _ROLE_ASSISTANT)
+
+# Display prefix and color per role. They are derived from the role rather
+# than stored on every message, so a Message only carries its data columns.
+ROLE_DISPLAY = {
+    _ROLE_SYSTEM: ("Sys > ", "yellow"),
+    _ROLE_USER: ("You > ", "cyan"),
+    _ROLE_ASSISTANT: ("AI > ", "green"),
+    _ROLE_ERROR: ("Sys > ", "red"),
+}
+
+# Escapes Rich markup in one pass; Rich only treats "[" as markup, so a
+# closing bracket is left as is (an escaped "]" would render its backslash)
+_MARKUP_ESCAPE = str.maketrans({"[": r"\["})
+
+
 class Message:
     """Represents a single message."""
     
-    role: str  # "user", "assistant", "system"
-    content: str
-    prefix: str = ""  # For display (e.g., "You > ", "AI > ")
-    color: str = ""   # For display (e.g., "cyan", "green")
+    __slots__ = ("role", "_content", "_chunks", "_escaped", "_rendered")
+    
+    def __init__(self, role: str, content: str):
+        self.role = role  # "user", "assistant", "system", "error"
+        self._content = content
+        # Streamed fragments not yet joined into _content
+        self._chunks: List[str] = []
+        # (content, escaped content) for the content it was computed from
+        self._escaped: Optional[Tuple[str, str]] = None
+        # (content, prefix + content) for the content it was computed from
+        self._rendered: Optional[Tuple[str, str]] = None
+    
+    def __repr__(self) -> str:
+        return f"Message(role={self.role!r}, content={self.content!r})"
+    
+    @property
+    def content(self) -> str:
+        """Message text, with any streamed chunks joined in on first access."""
+        if self._chunks:
+            self._content += "".join(self._chunks)
+            self._chunks.clear()
+        return self._content
+    
+    @content.setter
+    def content(self, content: str) -> None:
+        self._content = content
+        self._chunks.clear()
+    
+    def append(self, chunk: str) -> None:
+        """Append a streamed chunk without copying the text received so far."""
+        self._chunks.append(chunk)
+    
+    @property
+    def tokens(self) -> int:
+        """Estimated token count of the content."""
+        return _estimate_tokens(self.content)
+    
+    @property
+    def escaped_content(self) -> str:
+        """Content with Rich markup brackets escaped, computed once per content value."""
+        content = self.content
+        if self._escaped is None or self._escaped[0] is not content:
+            self._escaped = (content, content.translate(_MARKUP_ESCAPE))
+        return self._escaped[1]
+    
+    @property
+    def rendered(self) -> str:
+        """Prefix and content as one plain-text line, computed once per content value."""
+        content = self.content
+        if self._rendered is None or self._rendered[0] is not content:
+            self._rendered = (content, self.prefix + content)
+        return self._rendered[1]
+    
+    @property
+    def prefix(self) -> str:
+        """Display prefix (e.g., "You > ", "AI > ")."""
+        return ROLE_DISPLAY.get(self.role, ("", ""))[0]
+    
+    @property
+    def color(self) -> str:
+        """Display color (e.g., "cyan", "green")."""
+        return ROLE_DISPLAY.get(self.role, ("", ""))[1]
 
 
-@dataclass
 class AppState:
     """Manages application state."""
     
-    chat_history: List[Message] = field(default_factory=list)
-    selected_files: List[Path] = field(default_factory=list)
-    file_contents: dict = field(default_factory=dict)  # filename -> content mapping
-    current_input: str = ""
-    is_waiting_for_response: bool = False
-    streaming_task: Optional[asyncio.Task] = None  # Track the current streaming task
+    __slots__ = (
+        "chat_history",
+        "selected_files",
+        "file_contents",
+        "current_input",
+        "is_waiting_for_response",
+        "streaming_task",
+        "_file_cache",
+        "_context_fragments",
+        "_context_dirty",
+        "_api_messages",
+        "_token_total",
+        "user_messages",
+        "history_version",
+    )
+    
+    def __init__(self):
+        """Initialize empty state."""
+        self.chat_history: List[Message] = []
+        self.selected_files: List[Path] = []
+        self.file_contents: List[Tuple[str, str]] = []  # (filename, content) in attach order
+        self.current_input: str = ""
+        self.is_waiting_for_response: bool = False
+        self.streaming_task: Optional[asyncio.Task] = None  # Track the current streaming task
+        # (path, mtime_ns, size) -> content, in LRU order
+        self._file_cache: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        # Memoized get_context_fragments() result, rebuilt only after file_contents changes
+        self._context_fragments: List[str] = []
+        self._context_dirty: bool = True
+        # API-ready {"role", "content"} dicts for user/assistant turns, kept in step with chat_history
+        self._api_messages: List[dict] = []
+        # Running token estimate of _api_messages
+        self._token_total: int = 0
+        # Contents of user messages in send order, for input history navigation
+        self.user_messages: List[str] = []
+        # Bumped whenever messages are added or cleared, so views can cache
+        # renders of the messages before the last one
+        self.history_version: int = 0
     
-    def add_message(self, role: str, content: str, prefix: str = "", color: str = "") -> None:
+    def add_message(self, role: str, content: str) -> None:
         """Add a message to chat history."""
-        msg = Message(role=role, content=content, prefix=prefix, color=color)
+        role = sys.intern(role)
+        msg = Message(role=role, content=content)
         self.chat_history.append(msg)
+        self.history_version += 1
+        if role in _API_ROLES:
+            self._api_messages.append({"role": role, "content": content})
+            self._token_total += msg.tokens
+        if role is _ROLE_USER:
+            self.user_messages.append(content)
+    
+    def finish_streamed_message(self) -> None:
+        """
+        Sync the API conversation with the last user/assistant message's content.
+        
+        Call it once a reply has been streamed in with Message.append().
+        """
+        for msg in reversed(self.chat_history):
+            if msg.role in _API_ROLES:
+                self._sync_last_api_message(msg.content)
+                return
+    
+    def _sync_last_api_message(self, content: str) -> None:
+        """Set the content of the last API message and adjust the token estimate."""
+        api_message = self._api_messages[-1]
+        self._token_total += _estimate_tokens(content) - _estimate_tokens(api_message["content"])
+        api_message["content"] = content
     
     def add_system_message(self, content: str) -> None:
         """Add a system message."""
-        self.add_message("system", content, prefix="Sys > ", color="yellow")
+        self.add_message(_ROLE_SYSTEM, content)
     
     def add_user_message(self, content: str) -> None:
         """Add a user message."""
-        self.add_message("user", content, prefix="You > ", color="cyan")
+        self.add_message(_ROLE_USER, content)
     
     def add_assistant_message(self, content: str) -> None:
         """Add an assistant message."""
-        self.add_message("assistant", content, prefix="AI > ", color="green")
+        self.add_message(_ROLE_ASSISTANT, content)
     
     def add_error_message(self, error: str) -> None:
         """Add an error message."""
-        self.add_message("error", error, prefix="Sys > ", color="red")
+        self.add_message(_ROLE_ERROR, error)
     
-    def add_selected_files(self, files: List[Path]) -> None:
-        """Add selected files and load their contents."""
+    async def add_selected_files(self, files: List[Path]) -> None:
+        """Add selected files and load their contents in worker threads."""
         self.selected_files = files
         self.file_contents.clear()
+        self._context_dirty = True
+        
+        # Read all files in parallel so large attachments don't stall the event loop
+        results = await asyncio.gather(
+            *(self._load_file(file_path) for file_path in files),
+            return_exceptions=True,
+        )
+        
+        for file_path, result in zip(files, results):
+            if isinstance(result, Exception):
+                self.add_error_message(f"Failed to read {file_path.name}: {str(result)}")
+            elif result is not None:
+                self.file_contents.append((file_path.name, result))
+        self._context_dirty = True
+    
+    async def _load_file(self, file_path: Path) -> Optional[str]:
+        """Load a regular file, reusing the cached content if it has not changed on disk."""
+        try:
+            st = await asyncio.to_thread(file_path.stat)
+        except FileNotFoundError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        key = (str(file_path), st.st_mtime_ns, st.st_size)
+        
+        content = self._file_cache.get(key)
+        if content is not None:
+            self._file_cache.move_to_end(key)
+            return content
+        
+        content = await asyncio.to_thread(_read_text, file_path)
         
-        for file_path in files:
-            try:
-                if file_path.is_file():
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        self.file_contents[file_path.name] = f.read()
-            except Exception as e:
-                self.add_error_message(f"Failed to read {file_path.name}: {str(e)}")
+        self._file_cache[key] = content
+        if len(self._file_cache) > FILE_CACHE_SIZE:
+            self._file_cache.popitem(last=False)
+        return content
     
     def clear_selected_files(self) -> None:
         """Clear selected files."""
         self.selected_files.clear()
         self.file_contents.clear()
+        self._context_dirty = True
     
-    def get_context_prompt(self) -> str:
-        """Get context prompt with file contents."""
+    def get_context_fragments(self) -> List[str]:
+        """
+        Get the file context prompt as ordered string fragments.
+        
+        Joined, the fragments form the context system message. They are kept
+        separate so attached file contents can be encoded and sent one by one
+        instead of being copied into a single prompt string. Returns an empty
+        list when no files are attached.
+        """
+        if not self._context_dirty:
+            return self._context_fragments
+        
+        self._context_fragments = self._build_context_fragments()
+        self._context_dirty = False
+        return self._context_fragments
+    
+    def _build_context_fragments(self) -> List[str]:
+        """Build the context prompt fragments from the attached file contents."""
         if not self.file_contents:
-            return ""
+            return []
         
-        context_parts = ["Additional context from attached files:"]
-        for filename, content in self.file_contents.items():
-            context_parts.append(f"\n--- File: {filename} ---\n{content}")
+        fragments = ["Additional context from attached files:"]
+        for filename, content in self.file_contents:
+            fragments.append(f"\n\n--- File: {filename} ---\n")
+            fragments.append(content)
         
-        return "\n".join(context_parts)
+        return fragments
     
     def clear_history(self) -> None:
         """Clear chat history."""
         self.chat_history.clear()
+        self._api_messages.clear()
+        self._token_total = 0
+        self.user_messages.clear()
+        self.history_version += 1
+    
+    def maybe_summarize(self, token_limit: int) -> bool:
+        """
+        Summarize older turns once the conversation nears the token limit.
+        
+        When the estimate exceeds SUMMARIZE_THRESHOLD of token_limit, the
+        oldest API messages are replaced by one system message holding a short
+        excerpt of each, keeping the newest messages verbatim within
+        SUMMARIZE_KEEP of the limit. The oldest excerpts are dropped so the
+        summary fits in the rest of the threshold. The displayed chat history
+        is left as is.
+        Returns True if older messages were summarized.
+        """
+        if self._token_total <= token_limit * SUMMARIZE_THRESHOLD:
+            return False
+        
+        # Keep the newest message, then as many earlier ones as fit the budget
+        messages = self._api_messages
+        budget = token_limit * SUMMARIZE_KEEP
+        cut = len(messages) - 1
+        kept = _estimate_tokens(messages[cut]["content"])
+        while cut > 0:
+            tokens = _estimate_tokens(messages[cut - 1]["content"])
+            if kept + tokens > budget:
+                break
+            kept += tokens
+            cut -= 1
+        
+        # Nothing to gain if only a previous summary would be replaced
+        if cut == 0 or (cut == 1 and messages[0]["role"] == _ROLE_SYSTEM):
+            return False
+        
+        lines = []
+        for message in messages[:cut]:
+            if message["role"] == _ROLE_SYSTEM:
+                # A previous summary: carry its excerpts over
+                lines.extend(message["content"].split("\n")[1:])
+            else:
+                excerpt = " ".join(message["content"].split())[:SUMMARY_EXCERPT_CHARS]
+                lines.append(f"- {message['role']}: {excerpt}")
+        
+        summary_budget = token_limit * (SUMMARIZE_THRESHOLD - SUMMARIZE_KEEP)
+        summary_tokens = _estimate_tokens(_SUMMARY_HEADER)
+        first = len(lines)
+        while first > 0:
+            tokens = _estimate_tokens(lines[first - 1]) + 1
+            if summary_tokens + tokens > summary_budget:
+                break
+            summary_tokens += tokens
+            first -= 1
+        summary = "\n".join([_SUMMARY_HEADER, *lines[first:]])
+        
+        messages[:cut] = [{"role": _ROLE_SYSTEM, "content": summary}]
+        self._token_total = sum(_estimate_tokens(message["content"]) for message in messages)
+        return True
     
     def get_conversation_for_api(self) -> List[dict]:
-        """Get conversation history formatted for API with file context."""
-        messages = []
-        
-        # Add file context as a system message at the beginning if files are attached
-        context_prompt = self.get_context_prompt()
-        if context_prompt:
-            messages.append({
-                "role": "system",
-                "content": context_prompt
-            })
-        
-        # Add chat history
-        for msg in self.chat_history:
-            if msg.role != "error" and msg.role != "system":
-                messages.append({
-                    "role": msg.role,
-                    "content": msg.content
-                })
-        
-        return messages
+        """
+        Get conversation history formatted for API.
+        
+        File context is not included; it is sent as a leading system message
+        built from get_context_fragments().
+        """
+        return list(self._api_messages)
     
     def estimate_tokens(self, text: str) -> int:
         """Estimate token count (rough approximation: 1 token ≈ 4 characters)."""
-        return len(text) // 4
+        return _estimate_tokens(text)
     
     def get_estimated_message_tokens(self) -> int:
         """Estimate total tokens in conversation."""
-        total = 0
-        for msg in self.chat_history:
-            if msg.role in ("user", "assistant"):
-                total += self.estimate_tokens(msg.content)
-        return total
+        return self._token_total
     
     def set_streaming_task(self, task: Optional[asyncio.Task]) -> None:
         """Set the current streaming task."""
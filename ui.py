@@ -1,82 +1,331 @@
 """Textual UI for the chat application."""
 import asyncio
+import logging
+import os
+import re
+import time
 from pathlib import Path
-from typing import List
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from textual.app import ComposeResult
 from textual.widgets import Static, Input, Button, Label
 from textual.containers import ScrollableContainer, Horizontal, Vertical
 from textual.screen import ModalScreen
 
-from state import app_state
+from api import APIClient
+from state import Message, app_state
 from config import config
 
 
+logger = logging.getLogger(__name__)
+
+# Number of most recent messages rendered initially, and how many more are
+# loaded each time the chat is scrolled to the top
+RENDER_WINDOW = 30
+RENDER_WINDOW_STEP = 30
+
+# The chat keeps following new content while the view is within this many
+# lines of the bottom
+SCROLL_FOLLOW_LINES = 2
+
+# Seconds between chat redraws while a response is streaming
+STREAM_REFRESH_INTERVAL = 1 / 30
+
+# Seconds between streaming redraws while the terminal does not have focus
+BLURRED_REFRESH_INTERVAL = 1.0
+
+# Inline markdown delimiters (longest first) and the markup style each maps to
+_INLINE_DELIMITERS = (
+    ("***", "bold italic"),
+    ("___", "bold italic"),
+    ("**", "bold"),
+    ("__", "bold"),
+    ("*", "italic"),
+    ("_", "italic"),
+)
+
+# Any character that can open an inline construct, found in one scan
+_INLINE_DELIMITER_RE = re.compile(r"[*_`]")
+
+# Header prefixes (longest first) and their markup style
+_HEADERS = (
+    ("### ", "bold"),
+    ("## ", "bold blue"),
+    ("# ", "bold cyan"),
+)
+
+# File extensions that can be attached from the file picker
+_SUPPORTED_EXTS = frozenset({
+    ".py", ".md", ".txt", ".json", ".yaml", ".yml",
+    ".toml", ".cfg", ".ini", ".csv", ".xml", ".html",
+    ".js", ".ts", ".css", ".sh", ".bash", ".zsh",
+})
+
+# Characters every markdown construct handled by the renderer starts with
+_MARKDOWN_SENTINELS = "*_`#|"
+
+# Deletes square brackets in one pass, for the last-resort plain rendering
+_STRIP_BRACKETS = str.maketrans("", "", "[]")
+
+# Characters a table separator row (e.g. "|---|:--|") is made of
+_TABLE_SEPARATOR_CHARS = frozenset("|-: ")
+
+
+def _find_inline_delimiter(line: str, start: int) -> int:
+    """Find the next inline markdown delimiter character at or after start."""
+    match = _INLINE_DELIMITER_RE.search(line, start)
+    return match.start() if match else -1
+
+
+def _render_inline(line: str) -> str:
+    """Style emphasis and inline code in a single line of markdown."""
+    out = []
+    i = 0
+    while True:
+        j = _find_inline_delimiter(line, i)
+        if j == -1:
+            out.append(line[i:])
+            break
+        out.append(line[i:j])
+        i = j + 1
+
+        ch = line[j]
+        if ch == "`":
+            end = line.find("`", j + 1)
+            if end > j + 1:
+                out.append(f"[cyan]{line[j + 1:end]}[/cyan]")
+                i = end + 1
+            else:
+                out.append(ch)
+            continue
+
+        # Underscores inside words (snake_case) are not emphasis
+        if ch == "_" and j > 0 and line[j - 1].isalnum():
+            out.append(ch)
+            continue
+
+        for delimiter, style in _INLINE_DELIMITERS:
+            if not line.startswith(delimiter, j):
+                continue
+            inner_start = j + len(delimiter)
+            end = line.find(delimiter, inner_start)
+            if end > inner_start:
+                out.append(f"[{style}]{_render_inline(line[inner_start:end])}[/{style}]")
+                i = end + len(delimiter)
+                break
+        else:
+            # Unclosed (e.g. still streaming): keep the character as-is
+            out.append(ch)
+
+    return "".join(out)
+
+
+def _render_markdown_fast(text: str) -> str:
+    """
+    Style markdown with Rich markup in one pass over the lines of text.
+    
+    Handles fenced code blocks, tables, headers, emphasis and inline code.
+    Unclosed constructs (common while streaming) are left as plain text,
+    except an open code fence, which is closed at the end of the text.
+    """
+    out = []
+    in_code = False
+    in_table = False
+
+    for line in text.split("\n"):
+        if line.startswith("```"):
+            out.append("[/dim cyan]" if in_code else "[dim cyan]")
+            in_code = not in_code
+            in_table = False
+            continue
+        if in_code:
+            out.append(line)
+            continue
+
+        # Table rows are recognised per line, so stray pipes cost nothing extra
+        stripped = line.strip() if "|" in line else ""
+        if len(stripped) > 1 and stripped[0] == "|" and stripped[-1] == "|":
+            if _TABLE_SEPARATOR_CHARS.issuperset(stripped):  # Separator row
+                out.append(f"[dim cyan]{line}[/dim cyan]")
+            elif not in_table:  # Header row
+                out.append(f"[bold cyan]{_render_inline(line)}[/bold cyan]")
+            else:  # Data rows
+                out.append(_render_inline(line))
+            in_table = True
+            continue
+        in_table = False
+
+        for prefix, style in _HEADERS:
+            if line.startswith(prefix):
+                out.append(f"[{style}]{_render_inline(line[len(prefix):])}[/{style}]")
+                break
+        else:
+            out.append(_render_inline(line))
+
+    if in_code:
+        out.append("[/dim cyan]")
+
+    return "\n".join(out)
+
+
+def _stable_markdown_split(text: str) -> int:
+    """
+    Find where the complete markdown blocks of a streaming text end.
+    
+    Returns the index of the last blank line that is not inside a code
+    fence, or 0 if there is none. Text before it no longer changes as more
+    chunks arrive.
+    """
+    end = text.rfind("\n\n")
+    while end > 0:
+        head = text[:end]
+        if head.count("```") % 2 == 0:
+            return end
+        # The blank line is inside an open fence: look before the fence
+        end = text.rfind("\n\n", 0, head.rfind("```"))
+    return 0
+
+
 class ChatContent(Static):
     """Inner static widget for chat display content."""
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        # id(message) -> (content, rendered), so a message is only re-rendered
+        # when its content changed: fallback markup for assistant messages, and
+        # the list of Rich renderables for every message
+        self._md_cache: Dict[int, Tuple[str, str]] = {}
+        self._renderable_cache: Dict[int, Tuple[str, List[Any]]] = {}
+        # Only the last `window` messages are rendered
+        self.window = RENDER_WINDOW
+        # ((history version, window), Group of every visible block but the
+        # last message's); only the last message changes while streaming
+        self._frozen: Optional[Tuple[Tuple[int, int], Any]] = None
+        # (id(message), text, Markdown) of the complete blocks of the reply
+        # being streamed
+        self._streaming_head: Optional[Tuple[int, str, Any]] = None
+        # ((history version, window, id(last message), streaming), last
+        # message's content, Group): Textual renders twice per layout refresh
+        # (once to measure, once to paint), and the second render reuses this
+        self._rendered: Optional[Tuple[Tuple[int, int, int, bool], str, Any]] = None
+    
+    def load_earlier(self) -> bool:
+        """Widen the render window to include older messages. Returns True if it grew."""
+        if self.window >= len(app_state.chat_history):
+            return False
+        self.window += RENDER_WINDOW_STEP
+        self.refresh(layout=True)
+        return True
+    
+    def _visible_messages(self) -> Tuple[int, List[Message]]:
+        """Get the number of hidden older messages and the messages to render."""
+        history = app_state.chat_history
+        hidden = max(0, len(history) - self.window)
+        return hidden, history[hidden:]
+    
+    def _cached_render(self, cache: dict, msg: Message, build: Callable[[str], Any]) -> Any:
+        """Return build(msg.content), reusing the cached result while the content is unchanged."""
+        content = msg.content
+        entry = cache.get(id(msg))
+        # Content strings are replaced, never mutated, so identity means unchanged
+        if entry is not None and entry[0] is content:
+            return entry[1]
+        rendered = build(content)
+        cache[id(msg)] = (content, rendered)
+        return rendered
+    
+    def _prune_caches(self) -> None:
+        """Drop cached renders of messages that are no longer in the history."""
+        for cache in (self._md_cache, self._renderable_cache):
+            if len(cache) > len(app_state.chat_history):
+                live = {id(msg) for msg in app_state.chat_history}
+                for key in [key for key in cache if key not in live]:
+                    del cache[key]
     
     def _render_markdown(self, text: str) -> str:
         """
         Render markdown text to plain text with basic markup styling.
         Handles incomplete markdown gracefully during streaming.
         """
-        if not text:
+        # Plain prose has nothing to style
+        if not text or not any(ch in text for ch in _MARKDOWN_SENTINELS):
             return text
 
         try:
-            import re
-
-            result = text
-
-            # Tables - must be done before other replacements
-            # Find table blocks and style them
-            def style_table_rows(match):
-                table_text = match.group(0)
-                lines = table_text.split('\n')
-                styled_lines = []
-                for i, line in enumerate(lines):
-                    if i == 0:  # Header row
-                        styled_lines.append(f'[bold cyan]{line}[/bold cyan]')
-                    elif re.match(r'^\|[ \-\|:]+\|$', line):  # Separator row
-                        styled_lines.append(f'[dim cyan]{line}[/dim cyan]')
-                    else:  # Data rows
-                        styled_lines.append(line)
-                return '\n'.join(styled_lines)
-
-            # Find markdown tables (identified by | delimiters)
-            result = re.sub(
-                r'(\|.+\|\n(?:\|[ \-\|:]+\|\n)?(?:\|.+\|\n?)*)',
-                style_table_rows,
-                result,
-                flags=re.MULTILINE
-            )
+            return _render_markdown_fast(text)
+        except Exception:
+            # If markdown rendering fails, just return the original text
+            return text
 
-            # Headers
-            result = re.sub(r'^### (.*?)$', r'[bold]\1[/bold]', result, flags=re.MULTILINE)
-            result = re.sub(r'^## (.*?)$', r'[bold blue]\1[/bold blue]', result, flags=re.MULTILINE)
-            result = re.sub(r'^# (.*?)$', r'[bold cyan]\1[/bold cyan]', result, flags=re.MULTILINE)
+    def _message_renderables(self, msg: Message, content: str) -> List[Any]:
+        """Build the Rich renderables (prefix, content, spacer) for one message."""
+        from rich.markdown import Markdown
+        from rich.text import Text
 
-            # Bold and italic
-            result = re.sub(r'\*\*\*(.*?)\*\*\*', r'[bold italic]\1[/bold italic]', result)
-            result = re.sub(r'\*\*(.*?)\*\*', r'[bold]\1[/bold]', result)
-            result = re.sub(r'\*(.*?)\*', r'[italic]\1[/italic]', result)
-            result = re.sub(r'___(.*?)___', r'[bold italic]\1[/bold italic]', result)
-            result = re.sub(r'__(.*?)__', r'[bold]\1[/bold]', result)
-            result = re.sub(r'_(.*?)_', r'[italic]\1[/italic]', result)
+        prefix = msg.prefix or ""
+        content = content or ""
 
-            # Code (backticks) - use cyan color
-            result = re.sub(r'`([^`]+)`', r'[cyan]\1[/cyan]', result)
+        # Prepare prefix styling per role
+        if msg.role == "system":
+            prefix_text = Text(prefix, style="dim yellow")
+            # Text does not parse markup, so content needs no escaping here
+            content_text = Text(content)
+            renderables = [prefix_text, content_text]
+        elif msg.role == "error":
+            prefix_text = Text(prefix, style="bold red")
+            content_text = Text(content, style="bold red")
+            renderables = [prefix_text, content_text]
+        elif msg.role == "user":
+            prefix_text = Text(prefix, style="cyan")
+            content_text = Text(content)
+            renderables = [prefix_text, content_text]
+        elif msg.role == "assistant":
+            # For assistant messages use Markdown renderable so Rich
+            # will render tables, code blocks, lists, etc. Keep prefix
+            # colored green.
+            prefix_text = Text(prefix, style="green")
+            renderables = [prefix_text, Markdown(content)]
+        else:
+            renderables = [Text(prefix + content)]
 
-            # Code blocks
-            result = re.sub(r'```([^`]*?)```', r'[dim cyan]\1[/dim cyan]', result, flags=re.DOTALL)
+        # Add a blank line for spacing
+        renderables.append(Text(""))
+        return renderables
 
-            return result
-        except Exception:
-            # If markdown rendering fails, just return the original text
-            return text
+    def _message_blocks(self, msg: Message) -> List[Any]:
+        """Get the cached Rich renderables of a message, rebuilt only when its content changed."""
+        return self._cached_render(
+            self._renderable_cache,
+            msg,
+            lambda content: self._message_renderables(msg, content),
+        )
+
+    def _streaming_blocks(self, msg: Message) -> List[Any]:
+        """
+        Build the Rich renderables of an assistant reply that is still streaming.
+        
+        The Markdown of its complete blocks is parsed once and kept while new
+        chunks arrive; only the trailing block is parsed again on each render.
+        """
+        from rich.markdown import Markdown
+        from rich.text import Text
+
+        content = msg.content
+        split = _stable_markdown_split(content)
+        if not split:
+            return self._message_blocks(msg)
+
+        head = content[:split]
+        cached = self._streaming_head
+        if cached is None or cached[0] != id(msg) or cached[1] != head:
+            cached = self._streaming_head = (id(msg), head, Markdown(head))
+        return [
+            Text(msg.prefix, style="green"),
+            cached[2],
+            Text(""),
+            Markdown(content[split:].lstrip("\n")),
+            Text(""),
+        ]
 
     def render(self):
         """Render chat messages."""
@@ -90,89 +339,129 @@ class ChatContent(Static):
             )
             return welcome
 
+        self._prune_caches()
+
         # Try to use Rich renderables for better Markdown (tables, code blocks,
         # etc.). If rich isn't available or an error occurs, fall back to the
         # existing string-based renderer (_render_markdown).
         try:
             from rich.console import Group
-            from rich.markdown import Markdown
             from rich.text import Text
 
-            renderables = []
-
-            for msg in app_state.chat_history:
-                prefix = msg.prefix or ""
-                content = msg.content or ""
-
-                # Prepare prefix styling per role
-                if msg.role == "system":
-                    prefix_text = Text(prefix, style="dim yellow")
-                    # Escape brackets in system messages
-                    content_text = Text(content.replace("[", "\\[").replace("]", "\\]"))
-                    renderables.append(prefix_text)
-                    renderables.append(content_text)
-                elif msg.role == "error":
-                    prefix_text = Text(prefix, style="bold red")
-                    content_text = Text(content, style="bold red")
-                    renderables.append(prefix_text)
-                    renderables.append(content_text)
-                elif msg.role == "user":
-                    prefix_text = Text(prefix, style="cyan")
-                    content_text = Text(content.replace("[", "\\[").replace("]", "\\]"))
-                    renderables.append(prefix_text)
-                    renderables.append(content_text)
-                elif msg.role == "assistant":
-                    # For assistant messages use Markdown renderable so Rich
-                    # will render tables, code blocks, lists, etc. Keep prefix
-                    # colored green.
-                    prefix_text = Text(prefix, style="green")
-                    md = Markdown(content)
-                    renderables.append(prefix_text)
-                    renderables.append(md)
-                else:
-                    renderables.append(Text(prefix + content))
+            hidden, messages = self._visible_messages()
+            last = messages[-1]
+            streaming = last.role == "assistant" and app_state.is_streaming()
+            rendered_key = (app_state.history_version, self.window, id(last), streaming)
+            rendered = self._rendered
+            if rendered is not None and rendered[0] == rendered_key and rendered[1] is last.content:
+                return rendered[2]
 
-                # Add a blank line for spacing
-                renderables.append(Text(""))
+            key = (app_state.history_version, self.window)
+            if self._frozen is None or self._frozen[0] != key:
+                renderables = []
+                if hidden:
+                    renderables.append(Text(f"... {hidden} earlier messages (scroll up to load)\n", style="dim"))
+                for msg in messages[:-1]:
+                    renderables.extend(self._message_blocks(msg))
+                self._frozen = (key, Group(*renderables))
 
-            return Group(*renderables)
+            if streaming:
+                group = Group(self._frozen[1], *self._streaming_blocks(last))
+            else:
+                group = Group(self._frozen[1], *self._message_blocks(last))
+            self._rendered = (rendered_key, last.content, group)
+            return group
         except Exception:
+            logger.exception("Rich chat rendering failed; using the markup fallback")
             # Fallback: original string-based rendering using _render_markdown
             output_lines = []
-            for msg in app_state.chat_history:
+            hidden, messages = self._visible_messages()
+            if hidden:
+                output_lines.append(f"[dim]... {hidden} earlier messages (scroll up to load)[/dim]\n")
+            for msg in messages:
                 prefix = msg.prefix
                 content = msg.content
                 try:
                     if msg.role == "system":
-                        safe_content = content.replace("[", r"\[").replace("]", r"\]")
+                        safe_content = msg.escaped_content
                         line = f"[dim yellow]{prefix}[/dim yellow]{safe_content}"
                     elif msg.role == "error":
-                        safe_content = content.replace("[", r"\[").replace("]", r"\]")
+                        safe_content = msg.escaped_content
                         line = f"[bold red]{prefix}[/bold red][bold red]{safe_content}[/bold red]"
                     elif msg.role == "user":
-                        safe_content = content.replace("[", r"\[").replace("]", r"\]")
+                        safe_content = msg.escaped_content
                         line = f"[cyan]{prefix}[/cyan]{safe_content}"
                     elif msg.role == "assistant":
-                        rich_text = self._render_markdown(content)
+                        rich_text = self._cached_render(self._md_cache, msg, self._render_markdown)
                         line = f"[green]{prefix}[/green]{rich_text}"
                     else:
                         line = f"{prefix}{content}"
                     output_lines.append(line)
                 except Exception:
-                    safe_prefix = prefix.replace("[", "").replace("]", "")
-                    safe_content = content.replace("[", "").replace("]", "")
+                    safe_prefix = prefix.translate(_STRIP_BRACKETS)
+                    safe_content = content.translate(_STRIP_BRACKETS)
                     output_lines.append(f"{safe_prefix}{safe_content}")
                 output_lines.append("")
 
-            return "\n".join(output_lines)
+            from rich.errors import MarkupError
+            from rich.text import Text
+
+            # Parse the markup here, where a malformed tag can still fall back
+            # to plain text, rather than when the widget paints
+            try:
+                return Text.from_markup("\n".join(output_lines))
+            except MarkupError:
+                logger.exception("Chat markup could not be parsed; showing plain text")
+                # Only the visible messages, like the markup above; each one's
+                # "prefix + content" line is cached on the message
+                plain_lines = [f"... {hidden} earlier messages (scroll up to load)"] if hidden else []
+                plain_lines.extend(msg.rendered for msg in messages)
+                return Text("\n".join(plain_lines))
 
 
 class ChatDisplay(ScrollableContainer):
     """Display chat messages with scrolling."""
     
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # Whether new content is followed; only the user's scrolling changes
+        # it, so a redraw landing before a pending scroll_end can't turn it off
+        self.following = True
+    
     def compose(self):
         """Compose the chat display."""
         yield ChatContent(id="chat-content")
+    
+    def watch_scroll_y(self, old_value: float, new_value: float) -> None:
+        """Track whether to follow new content, and load older messages at the top."""
+        super().watch_scroll_y(old_value, new_value)
+        if self.max_scroll_y - new_value <= SCROLL_FOLLOW_LINES:
+            self.following = True
+        elif new_value < old_value:
+            # scroll_end only ever moves down, so moving up is the user
+            self.following = False
+        if new_value <= 0 < old_value:
+            self._load_earlier()
+    
+    def on_resize(self, event) -> None:
+        """A taller view may no longer overflow; load more history if so."""
+        self.call_after_refresh(self.fill_view)
+    
+    def fill_view(self) -> None:
+        """Render older messages until the content overflows, so there is something to scroll up to."""
+        if self.max_scroll_y <= 0 and self.query_one("#chat-content", ChatContent).load_earlier():
+            self.call_after_refresh(self.fill_view)
+    
+    def _load_earlier(self) -> None:
+        """Render more history above the current view, keeping the view in place."""
+        old_max_scroll_y = self.max_scroll_y
+        if not self.query_one("#chat-content", ChatContent).load_earlier():
+            return
+        
+        def keep_position() -> None:
+            self.scroll_to(y=self.max_scroll_y - old_max_scroll_y, animate=False)
+        
+        self.call_after_refresh(keep_position)
 
 
 class FilePickerScreen(ModalScreen):
@@ -228,6 +517,7 @@ class FilePickerScreen(ModalScreen):
         self.selected_files = []
         self.file_widgets = []
         self.focused_index = 0
+        self._prev_focused_index = -1
     
     def compose(self) -> ComposeResult:
         """Compose the file picker dialog."""
@@ -258,6 +548,7 @@ class FilePickerScreen(ModalScreen):
             file_container.remove_children()
             self.file_widgets.clear()
             self.focused_index = 0
+            self._prev_focused_index = -1
             
             # Update path display
             path_label = self.query_one("#file-picker-path", Label)
@@ -271,13 +562,17 @@ class FilePickerScreen(ModalScreen):
             
             # Get all items (files and directories)
             try:
-                for item in sorted(self.current_directory.iterdir()):
-                    if item.is_dir():
-                        items.append((f"📁 {item.name}/", item, True))
-                    elif item.is_file():
+                # One scandir pass: DirEntry.is_dir()/is_file() reuse the file
+                # type from the directory listing instead of stat()ing each entry
+                with os.scandir(self.current_directory) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+                for entry in entries:
+                    if entry.is_dir():
+                        items.append((f"📁 {entry.name}/", Path(entry.path), True))
+                    elif entry.is_file():
                         # Check if it's a supported file type
-                        if self._is_supported_file(item):
-                            items.append((item.name, item, False))
+                        if self._is_supported_file(entry.name):
+                            items.append((entry.name, Path(entry.path), False))
             except PermissionError:
                 file_container.mount(Label("[red]Permission denied[/red]"))
                 return
@@ -296,14 +591,9 @@ class FilePickerScreen(ModalScreen):
             file_container = self.query_one("#file-list", ScrollableContainer)
             file_container.mount(Label(f"[red]Error: {str(e)}[/red]"))
     
-    def _is_supported_file(self, file_path: Path) -> bool:
-        """Check if file is a supported type."""
-        supported_extensions = {
-            ".py", ".md", ".txt", ".json", ".yaml", ".yml",
-            ".toml", ".cfg", ".ini", ".csv", ".xml", ".html",
-            ".js", ".ts", ".css", ".sh", ".bash", ".zsh"
-        }
-        return file_path.suffix.lower() in supported_extensions
+    def _is_supported_file(self, name: str) -> bool:
+        """Check if a file name has a supported extension."""
+        return os.path.splitext(name)[1].lower() in _SUPPORTED_EXTS
     
     def on_button_pressed(self, event: Button.Pressed) -> None:
         """Handle button presses."""
@@ -312,7 +602,7 @@ class FilePickerScreen(ModalScreen):
             app_state.clear_selected_files()
             self.dismiss(False)
     
-    def on_key(self, event) -> None:
+    async def on_key(self, event) -> None:
         """Handle keyboard shortcuts."""
         if event.key == "escape":
             app_state.clear_selected_files()
@@ -340,19 +630,26 @@ class FilePickerScreen(ModalScreen):
                     self.populate_file_list()
                 else:
                     # Add this file and close picker
-                    app_state.add_selected_files([widget.file_path])
+                    await app_state.add_selected_files([widget.file_path])
                     self.dismiss(True)
             event.prevent_default()
     
     def _update_focus(self) -> None:
         """Update visual focus to current item."""
-        for i, widget in enumerate(self.file_widgets):
-            if i == self.focused_index:
-                widget.add_class("cursor")
-                widget.refresh()  # Refresh to re-render with bold
-            else:
-                widget.remove_class("cursor")
-                widget.refresh()  # Refresh to re-render without bold
+        # Nothing to repaint when the cursor did not move (e.g. up on the first item)
+        if self._prev_focused_index == self.focused_index:
+            return
+        
+        # Only the items losing and gaining the cursor need re-rendering
+        if 0 <= self._prev_focused_index < len(self.file_widgets):
+            widget = self.file_widgets[self._prev_focused_index]
+            widget.remove_class("cursor")
+            widget.refresh()  # Refresh to re-render without bold
+        
+        widget = self.file_widgets[self.focused_index]
+        widget.add_class("cursor")
+        widget.refresh()  # Refresh to re-render with bold
+        self._prev_focused_index = self.focused_index
 
 
 class FileItem(Static):
@@ -396,6 +693,22 @@ class FileItem(Static):
         self.display_name = display_name
         self.is_directory = is_directory
         self.can_focus = True
+        # Size label is computed once here rather than stat()ing on every render
+        self._size_str = "" if is_directory else self._format_size(file_path)
+    
+    @staticmethod
+    def _format_size(file_path: Path) -> str:
+        """Format a file's size for display."""
+        try:
+            file_size = file_path.stat().st_size
+        except (OSError, IOError):
+            return "---"
+        if file_size < 1024:
+            return f"{file_size}B"
+        elif file_size < 1024 * 1024:
+            return f"{file_size // 1024}KB"
+        else:
+            return f"{file_size // (1024 * 1024)}MB"
         
     def render(self) -> str:
         """Render the file item."""
@@ -409,17 +722,7 @@ class FileItem(Static):
                 return f"[cyan]{self.display_name}[/cyan]"
         
         # Show file with size, no checkbox
-        size = ""
-        try:
-            file_size = self.file_path.stat().st_size
-            if file_size < 1024:
-                size = f"{file_size}B"
-            elif file_size < 1024 * 1024:
-                size = f"{file_size // 1024}KB"
-            else:
-                size = f"{file_size // (1024 * 1024)}MB"
-        except (OSError, IOError):
-            size = "---"
+        size = self._size_str
         
         # Make focused file bold
         if is_focused:
@@ -435,6 +738,8 @@ class StreamingIndicator(Static):
         super().__init__(**kwargs)
         self._pulse_timer = None
         self._pulse_state = 0
+        # Streaming state currently shown; None until the first update
+        self._shown_streaming: Optional[bool] = None
     
     def render(self) -> str:
         """Render the streaming indicator."""
@@ -448,8 +753,12 @@ class StreamingIndicator(Static):
         self.update_indicator()
     
     def update_indicator(self) -> None:
-        """Update the indicator state and styling."""
+        """Update the indicator state and styling when streaming starts or stops."""
         is_streaming = app_state.is_streaming()
+        # The pulse timer animates the indicator; only state changes need work here
+        if is_streaming == self._shown_streaming:
+            return
+        self._shown_streaming = is_streaming
         self.display = is_streaming
         if is_streaming:
             self.add_class("streaming")
@@ -493,7 +802,7 @@ class MessageInput(Input):
     
     def get_user_messages(self) -> List[str]:
         """Get list of user messages from history."""
-        return [msg.content for msg in app_state.chat_history if msg.role == "user"]
+        return app_state.user_messages
     
     def on_key(self, event) -> None:
         """Handle key events for history navigation."""
@@ -534,8 +843,8 @@ class TUI:
         """Initialize the CLI."""
         pass
     
-    async def run(self) -> None:
-        """Run the TUI application."""
+    async def run(self, client: APIClient) -> None:
+        """Run the TUI application using a shared API client."""
         from textual.app import App
         
         class ChatApp(App):
@@ -594,6 +903,13 @@ class TUI:
             }
             """
             
+            def __init__(self, client: APIClient, **kwargs):
+                super().__init__(**kwargs)
+                self.client = client
+                # Set when streamed content changed; redrawn by the refresh timer
+                self._display_dirty = False
+                self._last_flush = 0.0
+            
             def compose(self) -> ComposeResult:
                 """Create child widgets."""
                 yield Static(self.get_banner(), id="banner")
@@ -626,18 +942,18 @@ class TUI:
             
             def on_mount(self) -> None:
                 """App mounted."""
+                # Widgets touched on every refresh are looked up once
+                self._chat_container = self.query_one("#chat-display", ChatDisplay)
+                self._chat_content = self._chat_container.query_one("#chat-content", ChatContent)
+                self._indicator = self.query_one("#streaming-indicator", StreamingIndicator)
+                self._input = self.query_one("#message-input", MessageInput)
+                self._input_shown = True
+                
                 app_state.add_system_message("Connected! Type a message or use /help")
                 self.refresh_chat_display()
                 
                 # Focus on input
-                input_widget = self.query_one("#message-input", MessageInput)
-                input_widget.focus()
-            
-            def on_resize(self, event) -> None:
-                """Handle terminal resize."""
-                # Refresh the banner when terminal is resized
-                banner = self.query_one("#banner", Static)
-                banner.update(self.get_banner())
+                self._input.focus()
             
             def on_key(self, event) -> None:
                 """Handle global key events."""
@@ -693,7 +1009,7 @@ class TUI:
                 
                 # Regular message - schedule async AI response as a worker
                 app_state.add_user_message(user_input)
-                self.refresh_chat_display()
+                self.refresh_chat_display(scroll_to_end=True)
                 self.run_worker(self._worker_get_response(user_input))
             
             def _handle_command_sync(self, cmd: str) -> None:
@@ -730,9 +1046,11 @@ class TUI:
                         app_state.add_system_message("No files attached")
                 elif cmd == "/save":
                     try:
-                        with open("chat_log.txt", "w") as f:
-                            for msg in app_state.chat_history:
-                                f.write(f"{msg.prefix}{msg.content}\n\n")
+                        with open("chat_log.txt", "w", encoding="utf-8") as f:
+                            f.writelines(
+                                f"{msg.rendered}\n\n"
+                                for msg in app_state.chat_history
+                            )
                         app_state.add_system_message("Chat saved to chat_log.txt")
                     except Exception as e:
                         app_state.add_error_message(f"Failed to save chat: {str(e)}")
@@ -790,13 +1108,17 @@ class TUI:
             
             async def get_ai_response(self, user_message: str) -> None:
                 """Get response from AI."""
-                from api import APIClient
-                
                 try:
                     app_state.is_waiting_for_response = True
                     
-                    # Prepare messages for API
+                    # Keep the conversation within the token limit
+                    if app_state.maybe_summarize(config.max_tokens):
+                        app_state.add_system_message("Earlier messages were summarized to fit the token limit.")
+                        self.refresh_chat_display()
+                    
+                    # Prepare messages and attached file context for API
                     messages = app_state.get_conversation_for_api()
+                    context = app_state.get_context_fragments()
                     
                     # Check token limits
                     tokens = app_state.estimate_tokens(user_message)
@@ -809,41 +1131,36 @@ class TUI:
                     # Add empty assistant message for streaming
                     app_state.add_assistant_message("")
                     self.refresh_chat_display()
+                    # Chunks go straight into the reply's buffer; it is joined when displayed
+                    append_chunk = app_state.chat_history[-1].append
                     
-                    # Stream response from API
-                    response_text = ""
-                    async with APIClient() as client:
-                        try:
-                            async for token in client.stream_chat(
-                                messages,
-                                max_tokens=config.max_tokens,
-                            ):
-                                # Check for cancellation
-                                try:
-                                    task = asyncio.current_task()
-                                    if task and task.cancelled():
-                                        raise asyncio.CancelledError()
-                                except RuntimeError:
-                                    pass
-                                
-                                response_text += token
-                                
-                                # Update the last message with accumulated response
-                                if app_state.chat_history and app_state.chat_history[-1].role == "assistant":
-                                    app_state.chat_history[-1].content = response_text
-                                
-                                # Refresh display for every token for better responsiveness
-                                self.refresh_chat_display()
-                                
-                                # Yield control to event loop more frequently
-                                await asyncio.sleep(0.001)
-                        except asyncio.CancelledError:
-                            # Streaming was cancelled - don't re-raise, just handle it
-                            # app_state.add_system_message("[Streaming cancelled by user]")
-                            self.refresh_chat_display()
-                        except Exception as stream_error:
-                            app_state.add_error_message(f"Stream error: {str(stream_error)}")
-                            self.refresh_chat_display()
+                    # Stream response from API; the display is redrawn by a timer
+                    # that only runs while the response streams
+                    refresh_timer = self.set_interval(STREAM_REFRESH_INTERVAL, self._flush_chat_display)
+                    try:
+                        async for token in self.client.stream_chat(
+                            messages,
+                            max_tokens=config.max_tokens,
+                            context=context,
+                        ):
+                            append_chunk(token)
+                            
+                            # Redrawn by the refresh timer, at most once per interval
+                            self._display_dirty = True
+                            
+                            # Let input and cancel handlers run between chunks
+                            await asyncio.sleep(0)
+                    except asyncio.CancelledError:
+                        # Streaming was cancelled - don't re-raise, just handle it
+                        # app_state.add_system_message("[Streaming cancelled by user]")
+                        self.refresh_chat_display()
+                    except Exception as stream_error:
+                        app_state.add_error_message(f"Stream error: {str(stream_error)}")
+                        self.refresh_chat_display()
+                    finally:
+                        refresh_timer.stop()
+                        # Flush the buffered chunks into the API conversation on every exit path
+                        app_state.finish_streamed_message()
                     
                     app_state.is_waiting_for_response = False
                     app_state.set_streaming_task(None)
@@ -855,48 +1172,51 @@ class TUI:
                     app_state.set_streaming_task(None)
                     self.refresh_chat_display()
             
-            def refresh_chat_display(self) -> None:
-                """Refresh the chat display widget."""
-                try:
-                    chat_container = self.query_one("#chat-display", ScrollableContainer)
-                    chat_content = chat_container.query_one("#chat-content", ChatContent)
-                    content_to_render = chat_content.render()
-                    chat_content.update(content_to_render)
-                    chat_container.scroll_end(animate=False)
-                    
-                    # Update streaming indicator
-                    indicator = self.query_one("#streaming-indicator", StreamingIndicator)
-                    indicator.update_indicator()
-                    
-                    # Update input visibility based on streaming state
-                    input_widget = self.query_one("#message-input", MessageInput)
-                    input_widget.display = not app_state.is_streaming()
-                    
-                except Exception:
-                    # If there's a rendering error, try to display a safe fallback
-                    try:
-                        chat_container = self.query_one("#chat-display", ScrollableContainer)
-                        chat_content = chat_container.query_one("#chat-content", ChatContent)
-                        # Display plain text fallback without markup
-                        plain_text = "\n".join([
-                            f"{msg.prefix}{msg.content}"
-                            for msg in app_state.chat_history
-                        ])
-                        chat_content.update(plain_text)
-                        chat_container.scroll_end(animate=False)
-                        
-                        # Update streaming indicator
-                        indicator = self.query_one("#streaming-indicator", StreamingIndicator)
-                        indicator.update_indicator()
-                        
-                        # Update input visibility based on streaming state
-                        input_widget = self.query_one("#message-input", MessageInput)
-                        input_widget.display = not app_state.is_streaming()
-                        
-                    except Exception:
-                        # If even fallback fails, log silently
-                        import sys
-                        print("ERROR refreshing display", file=sys.stderr)
+            def _flush_chat_display(self) -> None:
+                """Redraw the chat if streamed content arrived since the last redraw."""
+                if not self._display_dirty:
+                    return
+                now = time.monotonic()
+                # Streamed text keeps buffering while the terminal is in the
+                # background; it is only redrawn now and then (older Textual has no
+                # app_focus and is treated as always focused)
+                if not getattr(self, "app_focus", True) and now - self._last_flush < BLURRED_REFRESH_INTERVAL:
+                    return
+                self._last_flush = now
+                self.refresh_chat_display()
+            
+            def on_app_focus(self, event) -> None:
+                """Show content streamed while the terminal was in the background."""
+                self._flush_chat_display()
+            
+            def _update_input_display(self) -> None:
+                """Hide the input while streaming, touching the widget only when that changes."""
+                show_input = not app_state.is_streaming()
+                if show_input != self._input_shown:
+                    self._input_shown = show_input
+                    self._input.display = show_input
+            
+            def refresh_chat_display(self, scroll_to_end: bool = False) -> None:
+                """Refresh the chat display widget, following new content if the view is at the bottom."""
+                self._display_dirty = False
+                container = self._chat_container
+                # Don't pull the view down while the user is reading earlier messages
+                if scroll_to_end:
+                    container.following = True
+                # ChatContent.render() builds the content when the widget repaints,
+                # and falls back to simpler output itself if rendering fails
+                self._chat_content.refresh(layout=True)
+                if container.following:
+                    container.scroll_end(animate=False)
+                if self._chat_content.window < len(app_state.chat_history):
+                    # Older messages can only be loaded by scrolling up
+                    container.call_after_refresh(container.fill_view)
+                
+                # Update streaming indicator
+                self._indicator.update_indicator()
+                
+                # Update input visibility based on streaming state
+                self._update_input_display()
         
-        app = ChatApp()
+        app = ChatApp(client)
         await app.run_async()